@@ -5,6 +5,11 @@ import re
 import json
 from datetime import datetime
 
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
+
 # ---- App Configuration ----
 st.set_page_config(
     page_title="LaTeX to Jupyter Notebook Converter",
@@ -13,7 +18,7 @@ st.set_page_config(
 )
 
 # ---- Custom CSS for Better UI ----
-st.markdown("""
+_CSS = """
     <style>
     .stTextArea textarea {
         font-family: 'Courier New', monospace;
@@ -32,145 +37,149 @@ st.markdown("""
         margin: 0 auto;
     }
     </style>
-""", unsafe_allow_html=True)
+"""
 
 # ---- App Header ----
-st.title("🚀 TeX Studio to Colab Notebook Converter - © Michel Martins 😎")
-st.markdown("""
+_TITLE = "🚀 TeX Studio to Colab Notebook Converter - © Michel Martins 😎"
+_INTRO = """
 Convert LaTeX-formatted mathematical content into Colab Notebook SFT format.
 Paste your LaTeX content below and get a downloadable `.ipynb` file.
-""")
+"""
+
+# The page is rebuilt on every rerun, so these elements must be re-emitted
+# each time; caching the calls would replay them rather than skip them
+st.markdown(_CSS, unsafe_allow_html=True)
+st.title(_TITLE)
+st.markdown(_INTRO)
+
+# ---- Precompiled Patterns ----
+# A title ends at the first "]" and may not span lines or run into the next
+# \section*{, so an unclosed marker only scans up to the next one
+_SECTION_SPLIT_RE = re.compile(r"\\section\*{(\[[^\]\n\\]*(?:\\(?!section\*{)[^\]\n\\]*)*\])}")
+# Atomic parts put each \[...\] on its own lines. Equations are already
+# single-line here, so the body is bounded like _EQ_RE and to one line
+_ATOMIC_EQ_RE = re.compile(r'\\\[([^\\\n]*(?:\\(?![\[\]])[^\\\n]*)*)\\\]')
+_SECTION_LABEL_RE = re.compile(r'\[SECTION_\d+\]')
+_PROMPT_RESP_RE = re.compile(r'\b(PROMPT|RESPONSE)\b')
+
+# The equation body may not contain another \[ or \], so an unterminated \[
+# only scans up to the next equation and the pass stays linear overall
+_EQ_RE = re.compile(r"\\\[([^\\]*(?:\\(?![\[\]])[^\\]*)*)\\\]")
+
+# ---- Notebook Cell Templates ----
+# Shared between conversions, so they are tuples (encoded as JSON arrays) and
+# cannot be edited in place; they contain no delimiters to escape
+_METADATA_SRC = ("# Metadata\n\n**Topic:** - Mathematics\n\n**Subtopic:** - \n\n**Difficulty:** - \n\n**Explanation:** -  \n\n**Sections:** - \n\n**Prompt:** - \t\n",)
+_SEP_SRC = ("---",)
+
+def _cell(source, cell_id):
+    """Build a markdown cell; every cell in the notebook goes through here"""
+    return {"cell_type": "markdown", "source": source, "metadata": {}, "id": cell_id}
+
+def _sep_cell(cell_id):
+    return _cell(_SEP_SRC, cell_id)
+
+def _meta_cell():
+    return _cell(_METADATA_SRC, "metadata_cell")
 
 # ---- Your Processing Functions ----
-def transform_latex_equations(text):
-    pattern = r'\\\[\s*(.*?)\s*\\\]'
-    def replace_equation(match):
-        equation = match.group(1)
-        equation = re.sub(r'\s+', ' ', equation).strip()
-        return f'\\[ {equation} \\]'
-    return re.sub(pattern, replace_equation, text, flags=re.DOTALL)
+def _lines(text):
+    """Split cell text into nbformat source lines, each keeping its newline"""
+    return text.splitlines(keepends=True)
 
-def parse_input_to_notebook(text):
-    notebook = {
-        "cells": [],
+def escape_latex_delimiters(text):
+    # \( \) \[ \] get their backslash doubled so Markdown keeps the delimiters
+    return (text.replace("\\(", "\\\\(").replace("\\)", "\\\\)")
+                .replace("\\[", "\\\\[").replace("\\]", "\\\\]"))
+
+def _md(text, cell_id):
+    """Build a markdown cell from text, escaping delimiters before splitting into lines"""
+    return _cell(_lines(escape_latex_delimiters(text)), cell_id)
+
+def _replace_equation(match):
+    equation = ' '.join(match.group(1).split())
+    return f'\\[ {equation} \\]'
+
+def _atomic_repl(match):
+    return f"\\[\n{match.group(1).strip()}\n\\]"
+
+def perform_substitutions(input_text):
+    # Commands such as \frac or \theta are left untouched.
+    # Line breaks go first, so \\_ becomes \newline_ and not \_
+    return input_text.replace("\\\\", "\\newline").replace("\\_", "_")
+
+def transform_latex_text(text):
+    """Normalize \\[...\\] equations, then apply the LaTeX substitutions to the whole text"""
+    return perform_substitutions(_EQ_RE.sub(_replace_equation, text))
+
+def _iter_sections(text):
+    """Yield (title, content) per section marker, slicing the text lazily"""
+    title = None
+    content_start = 0
+    for match in _SECTION_SPLIT_RE.finditer(text):
+        if title is not None:
+            yield title, text[content_start:match.start()].strip()
+        title = match.group(1)
+        content_start = match.end()
+    if title is not None:
+        yield title, text[content_start:].strip()
+
+def _notebook(cells):
+    return {
+        "cells": cells,
         "metadata": {"colab": {"provenance": []}},
         "nbformat": 4,
         "nbformat_minor": 5
     }
-    metadata_text = """# Metadata\n\n**Topic:** - Mathematics\n\n**Subtopic:** - \n\n**Difficulty:** - \n\n**Explanation:** -  \n\n**Sections:** - \n\n**Prompt:** - \t\n"""
-    notebook["cells"].append({
-        "cell_type": "markdown",
-        "source": [metadata_text],
-        "metadata": {},
-        "id": "metadata_cell"
-    })
-
-    # First remove \end{document} if it exists in the text
-    text = re.sub(r'\\end{document}.*', '', text, flags=re.DOTALL)
-
-    sections = re.split(r"\\section\*{(\[.*?\])}", text)
-    for i in range(1, len(sections), 2):
-        section_title = sections[i]
-        section_content = sections[i + 1].strip()
-        
+
+def parse_input_to_notebook(text):
+    # Without section markers the whole text becomes a single cell
+    if not _SECTION_SPLIT_RE.search(text):
+        return _notebook([_meta_cell(), _md(text, "body"), _sep_cell("final_separator")])
+
+    cells = [_meta_cell()]
+
+    # One pass over the section markers; each section runs up to the next marker
+    parent_index = 0
+    atomic_index = -1
+    for k, (section_title, section_content) in enumerate(_iter_sections(text)):
+        i = 2 * k + 1
+
+        # Atomic parts are numbered within the section they follow
+        if section_title.startswith("[atomic_"):
+            atomic_index += 2
+            atomic_content = _ATOMIC_EQ_RE.sub(_atomic_repl, section_content)
+            # Every newline becomes a Markdown hard line break
+            atomic_content = atomic_content.replace("\n", "  \n")
+            cells.append(_md(
+                f"**{section_title}**\n\n{atomic_content}",
+                f"{section_title}_{parent_index}_{atomic_index}"
+            ))
+            continue
+        parent_index = i
+        atomic_index = -1
+
+        section_cell = _md(f"**{section_title}**\n\n{section_content}", f"section_{i}")
         # Add separator for SECTION_XX labels (like [SECTION_01], [SECTION_02], etc.)
-        if re.search(r'\[SECTION_\d+\]', section_title.upper()):
-            notebook["cells"].append({
-                "cell_type": "markdown",
-                "source": ["---"],
-                "metadata": {},
-                "id": f"separator_before_{section_title}"
-            })
+        if _SECTION_LABEL_RE.search(section_title.upper()):
+            cells.extend([_sep_cell(f"separator_before_{section_title}"), section_cell])
         # Also keep the original separator for PROMPT/RESPONSE
-        elif re.search(r'\b(PROMPT|RESPONSE)\b', section_title.upper()):
-            notebook["cells"].append({
-                "cell_type": "markdown",
-                "source": ["---"],
-                "metadata": {},
-                "id": f"separator_{i}"
-            })
-            
-        # Remove any remaining \end{document} in section content
-        section_content = re.sub(r'\\end{document}.*', '', section_content, flags=re.DOTALL)
-        
-        # Additional check for RESPONSE section to ensure no \end{document} remains
-        if "RESPONSE" in section_title.upper():
-            section_content = re.sub(r'\\end{document}.*', '', section_content, flags=re.DOTALL)
-        
-        notebook["cells"].append({
-            "cell_type": "markdown",
-            "source": [f"**{section_title}**\n\n{section_content}"],
-            "metadata": {},
-            "id": f"section_{i}"
-        })
-
-        atomic_parts = re.split(r"\\section\*{(\[atomic_.*?])}", section_content)
-        if len(atomic_parts) > 1:
-            for j in range(1, len(atomic_parts), 2):
-                atomic_title = atomic_parts[j]
-                atomic_content = atomic_parts[j + 1].strip()
-                atomic_content = re.sub(r'\\end{document}.*', '', atomic_content, flags=re.DOTALL)
-                atomic_content = re.sub(r'\\\[\s*(.*?)\s*\\\]', r'\\[\n\1\n\\]', atomic_content)
-                atomic_content = atomic_content.replace("\n", "  \n")
-                notebook["cells"].append({
-                    "cell_type": "markdown",
-                    "source": [f"**{atomic_title}**\n\n{atomic_content}"],
-                    "metadata": {},
-                    "id": f"{atomic_title}_{i}_{j}"
-                })
-
-    notebook["cells"].append({
-        "cell_type": "markdown",
-        "source": ["---"],
-        "metadata": {},
-        "id": "final_separator"
-    })
-
-    # Final cleanup of all cells to ensure no \end{document} remains
-    for cell in notebook["cells"]:
-        if cell["cell_type"] == "markdown":
-            # Apply multiple cleanup steps
-            cleaned_source = []
-            for text in cell["source"]:
-                # Replace escaped backslashes first
-                text = text.replace("\\\\", "\\")
-                # Remove \end{document} and anything after it
-                text = re.sub(r'\\end{document}.*', '', text, flags=re.DOTALL)
-                cleaned_source.append(text)
-            cell["source"] = cleaned_source
-
-    return notebook
+        elif _PROMPT_RESP_RE.search(section_title.upper()):
+            cells.extend([_sep_cell(f"separator_{i}"), section_cell])
+        else:
+            cells.append(section_cell)
+
+    cells.append(_sep_cell("final_separator"))
+
+    return _notebook(cells)
+
+def dump_notebook(notebook):
+    """Serialize the notebook to compact JSON bytes ending in a newline, using orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(notebook, option=orjson.OPT_APPEND_NEWLINE)
+    # One-shot dumps, since only that path uses the C encoder
+    return json.dumps(notebook, separators=(",", ":")).encode("utf-8") + b"\n"
 
-def perform_substitutions(input_text):
-    substitutions = [
-        (r"\\\\", r"\\newline"),
-        (r"\\frac", r"\\\\frac"),
-        (r"\\right", r"\\\\right"),
-        (r"\\rfloor", r"\\\\rfloor"),
-        (r"\\begin", r"\\\\begin"),
-        (r"\\theta", r"\\\\theta"),
-        (r"\\_", r"_"),
-    ]
-    output_text = input_text
-    for old, new in substitutions:
-        output_text = re.sub(old, new, output_text)
-    return output_text
-
-def escape_latex_delimiters_in_notebook(notebook):
-    delimiter_subs = [
-        (r'\\\(', r'\\\('),
-        (r'\\\)', r'\\\)'),
-        (r'\\\[', r'\\\['),
-        (r'\\\]', r'\\\]')
-    ]
-    for cell in notebook['cells']:
-        if cell['cell_type'] == 'markdown':
-            for i in range(len(cell['source'])):
-                text = cell['source'][i]
-                for old, new in delimiter_subs:
-                    text = re.sub(old, new, text)
-                cell['source'][i] = text
-    return notebook
 def extract_body_content(text):
     """Extract content between \begin{document} and \end{document}, ignoring everything else"""
     # Remove everything before \begin{document} if it exists
@@ -185,7 +194,27 @@ def extract_body_content(text):
     
     return text.strip()
 
+@st.cache_data(max_entries=32)
+def convert(input_text):
+    """Run the full conversion pipeline, returning (notebook, notebook_json_bytes)"""
+    # First extract the body content, ignoring document wrappers
+    body_content = extract_body_content(input_text)
+    # Process through transformations
+    output_text = transform_latex_text(body_content)
+    # Markdown delimiter escaping happens per cell, inside _md()
+    final_notebook = parse_input_to_notebook(output_text)
+
+    # Convert to JSON bytes
+    return final_notebook, dump_notebook(final_notebook)
+
 # ---- Main App Interface ----
+_PREVIEW_CELLS = 5
+_RESULT_KEYS = ("last_nb", "last_json", "last_input", "last_timestamp")
+
+def _clear_result():
+    for key in _RESULT_KEYS:
+        st.session_state.pop(key, None)
+
 input_text = st.text_area(
     "**Paste your LaTeX content here:**",
     height=300,
@@ -199,40 +228,46 @@ More content with $\theta$ symbols""",
 
 if st.button("**Convert to Jupyter Notebook**", type="primary"):
     if not input_text.strip():
+        _clear_result()
         st.warning("Please enter some LaTeX content first!")
     else:
         with st.spinner("Processing your LaTeX content..."):
             try:
-                # First extract the body content, ignoring document wrappers
-                body_content = extract_body_content(input_text)
-                # Process through transformations
-                transformed_text = transform_latex_equations(input_text)
-                output_text = perform_substitutions(transformed_text)
-                structured_notebook = parse_input_to_notebook(output_text)
-                final_notebook = escape_latex_delimiters_in_notebook(structured_notebook)
-
-                # Convert to JSON string
-                notebook_json = json.dumps(final_notebook, indent=2)
-
-                # Create download button
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                st.success("✅ Conversion successful!")
-
-                st.download_button(
-                    label="⬇️ Download Jupyter Notebook (.ipynb)",
-                    data=notebook_json,
-                    file_name=f"converted_notebook_{timestamp}.ipynb",
-                    mime="application/json",
-                    help="Click to download the Jupyter Notebook file"
-                )
-
-                # Show preview (collapsible)
-                with st.expander("Preview Notebook Structure"):
-                    st.json(final_notebook)
+                # Cached on the input text, so repeated clicks skip the pipeline
+                final_notebook, notebook_json = convert(input_text)
+                st.session_state["last_input"] = input_text
+                st.session_state["last_nb"] = final_notebook
+                st.session_state["last_json"] = notebook_json
+                st.session_state["last_timestamp"] = datetime.now().strftime("%Y%m%d_%H%M%S")
 
             except Exception as e:
+                _clear_result()
                 st.error(f"Conversion failed: {str(e)}")
 
+# The result lives in session state so it survives the reruns triggered by
+# the download button and the preview checkbox; it is dropped once the text
+# it was converted from has been edited
+if "last_nb" in st.session_state and st.session_state.get("last_input") != input_text:
+    _clear_result()
+
+if "last_nb" in st.session_state:
+    final_notebook = st.session_state["last_nb"]
+    timestamp = st.session_state["last_timestamp"]
+    st.success("✅ Conversion successful!")
+
+    st.download_button(
+        label="⬇️ Download Jupyter Notebook (.ipynb)",
+        data=st.session_state["last_json"],
+        file_name=f"converted_notebook_{timestamp}.ipynb",
+        mime="application/json",
+        help="Click to download the Jupyter Notebook file"
+    )
+
+    # Show preview (collapsible); only rendered on demand, and truncated
+    with st.expander("Preview Notebook Structure"):
+        if st.checkbox(f"Show preview (first {_PREVIEW_CELLS} cells)", key="show_preview"):
+            st.json(dict(final_notebook, cells=final_notebook["cells"][:_PREVIEW_CELLS]))
+
 # ---- Footer ----
 st.markdown("---")
 st.caption("""
@@ -3,6 +3,31 @@ import re
 import streamlit as st
 from typing import Tuple  # Add this import
 
+# Display math environments (equation, align, gather, etc.)
+_DISPLAY_ENVS = '|'.join(re.escape(env) for env in [
+    'equation*', 'equation',
+    'align*', 'align',
+    'gather*', 'gather',
+    'multline*', 'multline'
+])
+
+# All conversions share one compiled alternation, so the text is scanned once.
+# A body may not contain another opening delimiter of its own kind, so an
+# unterminated delimiter only scans up to the next one and the pass stays
+# linear overall.
+_CONVERSION_RE = re.compile(
+    # \[...\] -> $$...$$
+    r'\\\[(?P<d1>[^\\]*(?:\\(?![\[\]])[^\\]*)*)\\\]'
+    # \begin{env}...\end{env} -> $$...$$
+    rf'|\\begin\{{(?P<env>{_DISPLAY_ENVS})\}}'
+    r'(?P<d2>[^\\]*(?:\\(?!(?:begin|end)\{(?P=env)\})[^\\]*)*)\\end\{(?P=env)\}'
+    # \(...\) -> $...$ (single line)
+    r'|\\\((?P<i1>[^\\\n]*(?:\\(?![()])[^\\\n]*)*)\\\)'
+    # \ensuremath{...} -> $...$ (single line)
+    r'|\\ensuremath\{(?P<i2>[^}\n\\]*(?:\\(?!ensuremath\{)[^}\n\\]*)*)\}'
+)
+
+@st.cache_data(max_entries=32)
 def convert_latex_delimiters(text: str) -> Tuple[str, int]:
     """
     Convert all LaTeX math environments to $...$ (inline) or $$...$$ (display) delimiters.
@@ -13,41 +38,22 @@ def convert_latex_delimiters(text: str) -> Tuple[str, int]:
         of math environments converted
     """
     conversion_count = 0
-    current_text = text  # Work on a copy that gets updated
-
-    # Helper function to count conversions
-    def convert_and_count(pattern, replacement, flags=0):
-        nonlocal conversion_count, current_text
-        new_text, count = re.subn(pattern, replacement, current_text, flags=flags)
-        if count > 0:
-            current_text = new_text
-            conversion_count += count
-        return new_text
-
-    # First handle all display math environments that span multiple lines
-    # \[...\] -> $$...$$
-    convert_and_count(r'\\\[((?:.|\n)*?)\\\]', r'$$\1$$')
-
-    # Other display math environments (equation, align, gather, etc.)
-    display_envs = [
-        'equation*', 'equation',
-        'align*', 'align',
-        'gather*', 'gather',
-        'multline*', 'multline'
-    ]
-
-    for env in display_envs:
-        pattern = rf'\\begin\{{{env}\}}((?:.|\n)*?)\\end\{{{env}\}}'
-        convert_and_count(pattern, r'$$\1$$')
-
-    # Inline math conversions
-    # \(...\) -> $...$
-    convert_and_count(r'\\\((.*?)\\\)', r'$\1$')
-
-    # \ensuremath{...} -> $...$
-    convert_and_count(r'\\ensuremath\{(.*?)\}', r'$\1$')
 
-    return current_text, conversion_count
+    def convert_and_count(match):
+        nonlocal conversion_count
+        conversion_count += 1
+        if match.group('d1') is not None:
+            body, delimiter = match.group('d1'), '$$'
+        elif match.group('d2') is not None:
+            body, delimiter = match.group('d2'), '$$'
+        else:
+            body, delimiter = match.group('i1') or match.group('i2') or '', '$'
+        # Math nested in the body (e.g. \(...\) inside \[...\]) is converted too
+        body = _CONVERSION_RE.sub(convert_and_count, body)
+        return f'{delimiter}{body}{delimiter}'
+
+    converted_text = _CONVERSION_RE.sub(convert_and_count, text)
+    return converted_text, conversion_count
 
 def main():
     st.set_page_config(